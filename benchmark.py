@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark script for the webhook callback viewer storage.
+Measures NDJSON export and import throughput against a temporary database.
+"""
+
+import argparse
+import io
+import os
+import tempfile
+import time
+
+from database import DatabaseManager
+from transfer import encode_ndjson, import_stream
+
+
+def populate(db, sessions, requests_per_session):
+    """Fill a database with sample sessions and requests"""
+    for i in range(sessions):
+        session_id = db.create_session(f'bench-user-{i % 10}')
+        for j in range(requests_per_session):
+            db.add_request(session_id, f'bench-user-{i % 10}', {
+                'method': 'POST',
+                'headers': {'Content-Type': 'application/json', 'X-Delivery-Id': f'{i}-{j}'},
+                'query_params': {},
+                'path': f'/api/callback/{session_id}',
+                'payload': {'event': 'user.created', 'data': {'user_id': j, 'email': 'test@example.com'}}
+            })
+
+
+def bench_export(db, compress):
+    """Export the whole database, returning (records, bytes, seconds)"""
+    output = io.BytesIO()
+    records = 0
+
+    def counted(source):
+        nonlocal records
+        for record in source:
+            records += 1
+            yield record
+
+    start = time.perf_counter()
+    for chunk in encode_ndjson(counted(db.export_records()), compress=compress):
+        output.write(chunk)
+    return records, output.getvalue(), time.perf_counter() - start
+
+
+def bench_import(data, directory, shards, compress):
+    """Import an export into a fresh database, returning (records, seconds)"""
+    db = DatabaseManager(os.path.join(directory, 'import', 'db.json'), shards)
+    start = time.perf_counter()
+    counts = import_stream(db, io.BytesIO(data), compressed=compress)
+    return counts['sessions'] + counts['requests'], time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sessions', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=20, help='Requests per session')
+    parser.add_argument('--shards', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"Populating {args.sessions} sessions x {args.requests} requests ({args.shards} shard(s))...")
+        db = DatabaseManager(os.path.join(directory, 'source', 'db.json'), args.shards)
+        populate(db, args.sessions, args.requests)
+
+        print("=" * 60)
+        for compress in (False, True):
+            label = 'gzip' if compress else 'plain'
+            records, data, seconds = bench_export(db, compress)
+            print(f"export {label:5}: {records / seconds:10.0f} records/s "
+                  f"{len(data) / seconds / 1024 / 1024:8.2f} MB/s ({len(data)} bytes)")
+
+            imported, seconds = bench_import(data, os.path.join(directory, label), args.shards, compress)
+            print(f"import {label:5}: {imported / seconds:10.0f} records/s ({imported} records)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+from collections import defaultdict
+import gzip
+import threading
+
+# brotli is optional; without it only gzip is offered
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def available_encodings():
+    """Get the content encodings this server can produce, most preferred first"""
+    return (['br'] if brotli else []) + ['gzip']
+
+
+def compress(data, encoding):
+    """Compress a response body with the given content encoding"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+class ResponseStats:
+    """Tracks bytes sent per endpoint so compression and 304 savings can be seen"""
+
+    def __init__(self):
+        self.endpoints = defaultdict(lambda: {
+            'responses': 0,
+            'not_modified': 0,
+            'compressed': 0,
+            'body_bytes': 0,
+            'sent_bytes': 0
+        })
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, body_bytes, sent_bytes, compressed=False, not_modified=False):
+        """Count one response"""
+        with self.lock:
+            stats = self.endpoints[endpoint or 'unknown']
+            stats['responses'] += 1
+            stats['not_modified'] += int(not_modified)
+            stats['compressed'] += int(compressed)
+            stats['body_bytes'] += body_bytes
+            stats['sent_bytes'] += sent_bytes
+
+    def snapshot(self):
+        """Get the counters with average bytes per response"""
+        with self.lock:
+            result = {}
+            for endpoint, stats in self.endpoints.items():
+                result[endpoint] = dict(stats)
+                result[endpoint]['avg_sent_bytes'] = stats['sent_bytes'] // max(1, stats['responses'])
+            return result
@@ -1,156 +1,491 @@
 from tinydb import TinyDB, Query
 from datetime import datetime
+from dedup import FingerprintIndex, MAX_DUPLICATE_TIMESTAMPS, fingerprint
+import copy
+import hashlib
+import threading
 import uuid
 import os
 
+
+def shard_paths(db_path, shards):
+    """Get the shard file paths for a database path and shard count"""
+    if shards <= 1:
+        return [db_path]
+    root, ext = os.path.splitext(db_path)
+    return [f'{root}.shard-{index}-of-{shards}{ext}' for index in range(shards)]
+
+
+def directory_path(db_path):
+    """Get the path of the shared user-to-session directory used when sharded"""
+    root, ext = os.path.splitext(db_path)
+    return f'{root}.directory{ext}'
+
+
+def shard_index(session_id, shards):
+    """Pick a shard for a session using a stable hash of its ID"""
+    # Python's hash() is salted per process, so use a real digest instead
+    digest = hashlib.sha1(session_id.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % max(1, shards)
+
+
+# Fields an imported session record must have
+IMPORT_SESSION_FIELDS = ['user_id', 'name', 'created_at', 'last_updated']
+
+
+class _Shard:
+    """One database file holding the sessions and requests routed to it"""
+
+    def __init__(self, path):
+        self.db = TinyDB(path)
+        self.sessions_table = self.db.table('sessions')
+        self.requests_table = self.db.table('requests')
+        # Recent capture fingerprints of sessions with dedup enabled
+        self.fingerprints = FingerprintIndex()
+        # Re-entrant so public methods can call each other while holding it
+        self.lock = threading.RLock()
+
+
 class DatabaseManager:
-    def __init__(self, db_path='data/db.json'):
+    def __init__(self, db_path='data/db.json', shards=1):
         # Ensure data directory exists
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
-        
-        self.db = TinyDB(db_path)
-        self.sessions_table = self.db.table('sessions')
-        self.requests_table = self.db.table('requests')
+
+        self.db_path = db_path
+        self.shard_count = max(1, int(shards))
+        self.shards = [_Shard(path) for path in shard_paths(db_path, self.shard_count)]
+
+        # With several shards, user-to-session listings come from a small shared directory
+        if self.shard_count > 1:
+            self.directory = TinyDB(directory_path(db_path))
+            self.directory_table = self.directory.table('sessions')
+            self.directory_lock = threading.Lock()
+        else:
+            self.directory = None
+
         self.Query = Query()
-    
+
+    def _shard(self, session_id):
+        """Get the shard that stores a session"""
+        return self.shards[shard_index(session_id, self.shard_count)]
+
+    def _directory_add(self, session_id, user_id):
+        """Record that a user has a session (sharded mode only)"""
+        if self.directory is None:
+            return
+        with self.directory_lock:
+            self.directory_table.upsert(
+                {'session_id': session_id, 'user_id': user_id},
+                (self.Query.session_id == session_id) & (self.Query.user_id == user_id)
+            )
+
+    def _directory_remove(self, session_id, user_id):
+        """Forget that a user has a session (sharded mode only)"""
+        if self.directory is None:
+            return
+        with self.directory_lock:
+            self.directory_table.remove(
+                (self.Query.session_id == session_id) & (self.Query.user_id == user_id)
+            )
+
     def create_session(self, user_id, session_id=None):
         """Create a new session for a user"""
         if session_id is None:
             session_id = str(uuid.uuid4())
-        
+
         session_data = {
             'session_id': session_id,
             'user_id': user_id,
             'name': f'Session {session_id[:8]}',
             'redirect_url': '',
+            'forward_targets': [],
             'created_at': datetime.now().isoformat(),
             'last_updated': datetime.now().isoformat()
         }
-        
-        self.sessions_table.insert(session_data)
+
+        shard = self._shard(session_id)
+        with shard.lock:
+            shard.sessions_table.insert(session_data)
+        self._directory_add(session_id, user_id)
         return session_id
-    
+
     def get_user_sessions(self, user_id):
         """Get all sessions for a specific user"""
-        sessions = self.sessions_table.search(self.Query.user_id == user_id)
-        
+        if self.directory is None:
+            shard = self.shards[0]
+            with shard.lock:
+                # search() hands out TinyDB's cached documents; copy before adding request_count
+                sessions = copy.deepcopy(shard.sessions_table.search(self.Query.user_id == user_id))
+        else:
+            with self.directory_lock:
+                entries = self.directory_table.search(self.Query.user_id == user_id)
+            sessions = [self.get_session(entry['session_id'], user_id) for entry in entries]
+            sessions = [session for session in sessions if session]
+
         # Add request count for each session
         for session in sessions:
-            session['request_count'] = len(self.get_session_requests(session['session_id']))
-        
+            shard = self._shard(session['session_id'])
+            with shard.lock:
+                session['request_count'] = shard.requests_table.count(
+                    self.Query.session_id == session['session_id']
+                )
+
         return sessions
-    
+
     def get_session(self, session_id, user_id):
         """Get a specific session if it belongs to the user"""
-        session = self.sessions_table.get(
-            (self.Query.session_id == session_id) & (self.Query.user_id == user_id)
-        )
+        shard = self._shard(session_id)
+        with shard.lock:
+            session = shard.sessions_table.get(
+                (self.Query.session_id == session_id) & (self.Query.user_id == user_id)
+            )
         return session
-    
+
     def update_session_name(self, session_id, user_id, name):
         """Update session name"""
-        result = self.sessions_table.update(
-            {'name': name, 'last_updated': datetime.now().isoformat()},
-            (self.Query.session_id == session_id) & (self.Query.user_id == user_id)
-        )
+        shard = self._shard(session_id)
+        with shard.lock:
+            result = shard.sessions_table.update(
+                {'name': name, 'last_updated': datetime.now().isoformat()},
+                (self.Query.session_id == session_id) & (self.Query.user_id == user_id)
+            )
         return len(result) > 0
-    
+
     def update_redirect_url(self, session_id, user_id, redirect_url):
         """Update session redirect URL"""
-        result = self.sessions_table.update(
-            {'redirect_url': redirect_url, 'last_updated': datetime.now().isoformat()},
-            (self.Query.session_id == session_id) & (self.Query.user_id == user_id)
-        )
+        shard = self._shard(session_id)
+        with shard.lock:
+            result = shard.sessions_table.update(
+                {'redirect_url': redirect_url, 'last_updated': datetime.now().isoformat()},
+                (self.Query.session_id == session_id) & (self.Query.user_id == user_id)
+            )
+        return len(result) > 0
+
+    def update_forward_targets(self, session_id, user_id, forward_targets):
+        """Update the list of targets requests are forwarded to"""
+        shard = self._shard(session_id)
+        with shard.lock:
+            result = shard.sessions_table.update(
+                {'forward_targets': forward_targets, 'last_updated': datetime.now().isoformat()},
+                (self.Query.session_id == session_id) & (self.Query.user_id == user_id)
+            )
         return len(result) > 0
-    
+
+    def update_dedup_config(self, session_id, user_id, dedup_config):
+        """Update duplicate detection settings (shared by everyone who has the session)"""
+        shard = self._shard(session_id)
+        with shard.lock:
+            if not self.session_exists(session_id, user_id):
+                return False
+
+            # Captures are shared, so every copy of the session gets the same settings
+            shard.sessions_table.update(
+                {'dedup': dedup_config, 'last_updated': datetime.now().isoformat()},
+                self.Query.session_id == session_id
+            )
+            if not dedup_config.get('enabled'):
+                shard.fingerprints.discard_session(session_id)
+        return True
+
     def delete_session(self, session_id, user_id):
         """Delete a session and all its requests"""
-        # Delete all requests for this session
-        self.requests_table.remove(self.Query.session_id == session_id)
-        
-        # Delete the session
-        result = self.sessions_table.remove(
-            (self.Query.session_id == session_id) & (self.Query.user_id == user_id)
-        )
+        shard = self._shard(session_id)
+        with shard.lock:
+            # Delete all requests for this session
+            shard.requests_table.remove(self.Query.session_id == session_id)
+
+            # Delete the session
+            result = shard.sessions_table.remove(
+                (self.Query.session_id == session_id) & (self.Query.user_id == user_id)
+            )
+            shard.fingerprints.discard_session(session_id)
+        self._directory_remove(session_id, user_id)
         return len(result) > 0
-    
+
     def add_request(self, session_id, user_id, request_data):
         """Add a request to a session"""
-        # Verify session belongs to user
-        session = self.get_session(session_id, user_id)
-        if not session:
+        shard = self._shard(session_id)
+        with shard.lock:
+            # Verify session belongs to user
+            session = self.get_session(session_id, user_id)
+            if not session:
+                return False
+
+            # Collapse redeliveries into the original capture when dedup is enabled
+            dedup_config = session.get('dedup') or {}
+            request_fingerprint = None
+            if dedup_config.get('enabled'):
+                request_fingerprint = fingerprint(request_data, dedup_config)
+                original_id = shard.fingerprints.get(session_id, request_fingerprint)
+                if original_id is not None and self._record_duplicate(shard, session_id, original_id, request_data):
+                    return True
+
+            # Get the next insertion order number for this session
+            existing_requests = shard.requests_table.search(self.Query.session_id == session_id)
+            next_order = max((req.get('insertion_order', 0) for req in existing_requests), default=0) + 1
+
+            # Add request data (without user_id for shared visibility)
+            request_data['session_id'] = session_id
+            request_data['timestamp'] = datetime.now().isoformat()
+            request_data['insertion_order'] = next_order
+
+            doc_id = shard.requests_table.insert(request_data)
+            if request_fingerprint is not None:
+                shard.fingerprints.add(session_id, request_fingerprint, doc_id, dedup_config['window_seconds'])
+
+            # Update session last_updated for all users who own this session
+            shard.sessions_table.update(
+                {'last_updated': datetime.now().isoformat()},
+                self.Query.session_id == session_id
+            )
+
+            # Keep only 20 most recent requests
+            self._limit_session_requests(session_id, 20)
+
+        return True
+
+    def _record_duplicate(self, shard, session_id, original_id, request_data):
+        """Count a redelivery against its original capture instead of storing it again"""
+        original = shard.requests_table.get(doc_id=original_id)
+        if not original or original.get('session_id') != session_id:
+            # The original was trimmed or deleted, so store this one as new
             return False
-        
-        # Get the next insertion order number for this session
-        existing_requests = self.requests_table.search(self.Query.session_id == session_id)
-        next_order = len(existing_requests) + 1
-        
-        # Add request data (without user_id for shared visibility)
-        request_data['session_id'] = session_id
-        request_data['timestamp'] = datetime.now().isoformat()
-        request_data['insertion_order'] = next_order
-        
-        self.requests_table.insert(request_data)
-        
-        # Update session last_updated for all users who own this session
-        self.sessions_table.update(
-            {'last_updated': datetime.now().isoformat()},
+
+        arrived_at = datetime.now().isoformat()
+        duplicate_count = original.get('duplicate_count', 0) + 1
+        duplicate_timestamps = (original.get('duplicate_timestamps', []) + [arrived_at])[-MAX_DUPLICATE_TIMESTAMPS:]
+        shard.requests_table.update(
+            {'duplicate_count': duplicate_count, 'duplicate_timestamps': duplicate_timestamps},
+            doc_ids=[original_id]
+        )
+
+        shard.sessions_table.update(
+            {'last_updated': arrived_at},
             self.Query.session_id == session_id
         )
-        
-        # Keep only 20 most recent requests
-        self._limit_session_requests(session_id, 20)
-        
+
+        request_data['session_id'] = session_id
+        request_data['timestamp'] = arrived_at
+        request_data['duplicate_of'] = original.get('insertion_order')
+        request_data['duplicate_count'] = duplicate_count
         return True
-    
+
     def get_session_requests(self, session_id, user_id=None):
         """Get all requests for a session (shared across all users who own the session)"""
-        requests = self.requests_table.search(self.Query.session_id == session_id)
+        shard = self._shard(session_id)
+        with shard.lock:
+            # Callers rewrite payloads for display, so never hand out TinyDB's cached documents
+            requests = copy.deepcopy(shard.requests_table.search(self.Query.session_id == session_id))
         # Sort by insertion order to maintain the exact order they were received
         return sorted(requests, key=lambda x: x.get('insertion_order', 0))
-    
+
     def _limit_session_requests(self, session_id, limit):
         """Keep only the most recent requests for a session (shared across all users)"""
-        requests = self.requests_table.search(self.Query.session_id == session_id)
-        if len(requests) > limit:
-            # Sort by insertion order and keep only the most recent
-            sorted_requests = sorted(requests, key=lambda x: x.get('insertion_order', 0))
-            requests_to_delete = sorted_requests[:-limit]
-            
-            # Delete older requests
-            for req in requests_to_delete:
-                self.requests_table.remove(self.Query.doc_id == req.doc_id)
-    
+        shard = self._shard(session_id)
+        with shard.lock:
+            requests = shard.requests_table.search(self.Query.session_id == session_id)
+            if len(requests) > limit:
+                # Sort by insertion order and keep only the most recent
+                sorted_requests = sorted(requests, key=lambda x: x.get('insertion_order', 0))
+                requests_to_delete = sorted_requests[:-limit]
+
+                # Delete older requests
+                shard.requests_table.remove(doc_ids=[req.doc_id for req in requests_to_delete])
+
     def session_exists(self, session_id, user_id):
         """Check if a session exists for a user"""
         return self.get_session(session_id, user_id) is not None
-    
+
     def get_session_by_id(self, session_id):
         """Get any session with the given session_id (regardless of user)"""
-        sessions = self.sessions_table.search(self.Query.session_id == session_id)
+        shard = self._shard(session_id)
+        with shard.lock:
+            sessions = copy.deepcopy(shard.sessions_table.search(self.Query.session_id == session_id))
         return sessions[0] if sessions else None
-    
+
     def copy_session_to_user(self, session_id, user_id):
         """Copy an existing session to a new user"""
-        # Get any existing session with this ID
-        existing_session = self.get_session_by_id(session_id)
-        if not existing_session:
-            return False
-        
-        # Check if user already has this session
-        if self.session_exists(session_id, user_id):
-            return True  # Already exists
-        
-        # Create a copy of the session for the user
-        copied_session = {
-            'session_id': session_id,
-            'user_id': user_id,
-            'name': existing_session['name'],
-            'created_at': existing_session['created_at'],
-            'last_updated': datetime.now().isoformat()
-        }
-        
-        self.sessions_table.insert(copied_session)
+        shard = self._shard(session_id)
+        with shard.lock:
+            # Get any existing session with this ID
+            existing_session = self.get_session_by_id(session_id)
+            if not existing_session:
+                return False
+
+            # Check if user already has this session
+            if self.session_exists(session_id, user_id):
+                return True  # Already exists
+
+            # Create a copy of the session for the user
+            copied_session = {
+                'session_id': session_id,
+                'user_id': user_id,
+                'name': existing_session['name'],
+                'created_at': existing_session['created_at'],
+                'last_updated': datetime.now().isoformat()
+            }
+            if 'dedup' in existing_session:
+                copied_session['dedup'] = existing_session['dedup']
+
+            shard.sessions_table.insert(copied_session)
+        self._directory_add(session_id, user_id)
         return True
-    
- 
\ No newline at end of file
+
+    def export_records(self, session_id=None, user_id=None):
+        """Yield session and request records for export.
+
+        With a session_id only that user's session is exported, otherwise every
+        session is. Shards are read one at a time so memory stays bounded.
+        """
+        if session_id is not None:
+            session = self.get_session(session_id, user_id)
+            if not session:
+                return
+            yield {'type': 'session', 'session': dict(session)}
+            for request_data in self.get_session_requests(session_id):
+                yield {'type': 'request', 'request': dict(request_data)}
+            return
+
+        for shard in self.shards:
+            with shard.lock:
+                sessions = shard.sessions_table.all()
+                requests = shard.requests_table.all()
+            for session in sessions:
+                yield {'type': 'session', 'session': dict(session)}
+            for request_data in sorted(requests, key=lambda x: (x.get('session_id', ''), x.get('insertion_order', 0))):
+                yield {'type': 'request', 'request': dict(request_data)}
+
+    def import_records(self, records):
+        """Write a batch of exported records, skipping ones that already exist"""
+        batches = {}
+        for record in records:
+            data = record.get(record['type'])
+            if not isinstance(data, dict) or not data.get('session_id'):
+                raise ValueError(f'{record["type"]} record without a session_id')
+            if record['type'] == 'session':
+                # The session endpoints read these fields directly
+                missing = [field for field in IMPORT_SESSION_FIELDS if not data.get(field)]
+                if missing:
+                    raise ValueError(f'session record without {", ".join(missing)}')
+            elif not isinstance(data.get('insertion_order'), int):
+                # Requests are deduplicated by their position within the session
+                raise ValueError('request record without an insertion_order')
+            sessions, requests = batches.setdefault(self._shard(data['session_id']), ([], []))
+            (sessions if record['type'] == 'session' else requests).append(data)
+
+        counts = {'sessions': 0, 'requests': 0}
+        for shard, (sessions, requests) in batches.items():
+            with shard.lock:
+                new_sessions = []
+                seen = set()
+                for session in sessions:
+                    key = (session['session_id'], session['user_id'])
+                    if key not in seen and not self.session_exists(*key):
+                        new_sessions.append(session)
+                    seen.add(key)
+                shard.sessions_table.insert_multiple(new_sessions)
+
+                # Requests are identified by their position within the session
+                existing = {
+                    (req.get('session_id'), req.get('insertion_order'))
+                    for req in shard.requests_table.search(
+                        self.Query.session_id.one_of(list({req['session_id'] for req in requests}))
+                    )
+                } if requests else set()
+                new_requests = []
+                for req in requests:
+                    key = (req['session_id'], req.get('insertion_order'))
+                    if key not in existing:
+                        new_requests.append(req)
+                    existing.add(key)
+                shard.requests_table.insert_multiple(new_requests)
+
+                # Sessions that gained requests changed just like after a capture,
+                # so pollers sending If-Modified-Since must see the new data
+                updated_ids = list({req['session_id'] for req in new_requests})
+                if updated_ids:
+                    shard.sessions_table.update(
+                        {'last_updated': datetime.now().isoformat()},
+                        self.Query.session_id.one_of(updated_ids)
+                    )
+                for session_id in updated_ids:
+                    self._limit_session_requests(session_id, 20)
+
+            for session in new_sessions:
+                self._directory_add(session['session_id'], session['user_id'])
+            counts['sessions'] += len(new_sessions)
+            counts['requests'] += len(new_requests)
+
+        return counts
+
+
+def _has_data(path):
+    """Check whether a database file holds any rows"""
+    if not os.path.exists(path):
+        return False
+    with TinyDB(path) as db:
+        return any(len(db.table(name)) for name in db.tables())
+
+
+def reshard(db_path, old_shards, new_shards, remove_old=False, force=False):
+    """Move all sessions and requests from one shard layout to another.
+
+    This works on the files directly and must be run while the server is stopped.
+    Target shard files that already hold data are only overwritten with force.
+    Returns the number of sessions and requests that were moved.
+    """
+    old_paths = shard_paths(db_path, old_shards)
+    new_paths = shard_paths(db_path, new_shards)
+    if old_paths == new_paths:
+        return 0, 0
+
+    # The directory isn't checked: it is rebuilt from the session rows, and
+    # when going from one sharded layout to another it is the old layout's own
+    if not force:
+        in_use = [path for path in new_paths if _has_data(path)]
+        if in_use:
+            raise ValueError(
+                f'Target shard files already hold data: {", ".join(in_use)}'
+            )
+
+    # Read everything from the old layout
+    sessions = []
+    requests = []
+    for path in old_paths:
+        if not os.path.exists(path):
+            continue
+        with TinyDB(path) as source:
+            sessions.extend(dict(doc) for doc in source.table('sessions').all())
+            requests.extend(dict(doc) for doc in source.table('requests').all())
+
+    # Route every row to its new shard
+    buckets = [([], []) for _ in new_paths]
+    for session in sessions:
+        buckets[shard_index(session['session_id'], new_shards)][0].append(session)
+    for request_data in requests:
+        buckets[shard_index(request_data['session_id'], new_shards)][1].append(request_data)
+
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    for path, (shard_sessions, shard_requests) in zip(new_paths, buckets):
+        with TinyDB(path) as target:
+            target.drop_tables()
+            target.table('sessions').insert_multiple(shard_sessions)
+            target.table('requests').insert_multiple(shard_requests)
+
+    # Rebuild the user-to-session directory from the session rows
+    if new_shards > 1:
+        with TinyDB(directory_path(db_path)) as directory:
+            directory.drop_tables()
+            directory.table('sessions').insert_multiple(
+                {'session_id': session['session_id'], 'user_id': session['user_id']}
+                for session in sessions
+            )
+
+    if remove_old:
+        for path in old_paths:
+            if os.path.exists(path):
+                os.remove(path)
+        if new_shards <= 1 and os.path.exists(directory_path(db_path)):
+            os.remove(directory_path(db_path))
+
+    return len(sessions), len(requests)
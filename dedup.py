@@ -0,0 +1,108 @@
+from collections import OrderedDict
+import hashlib
+import json
+import time
+
+# Request fields that can be part of a fingerprint
+FINGERPRINT_FIELDS = ['method', 'path', 'query_params', 'payload']
+
+DEFAULT_DEDUP_CONFIG = {
+    'enabled': False,
+    'fields': ['method', 'path', 'payload'],
+    'headers': [],
+    'window_seconds': 300
+}
+
+MAX_INDEX_ENTRIES = 10000
+
+# Arrival times kept per capture; the duplicate count itself is exact
+MAX_DUPLICATE_TIMESTAMPS = 100
+
+
+def fingerprint(request_data, config):
+    """Build a content fingerprint for a captured request"""
+    parts = {}
+    for field in config.get('fields', []):
+        value = request_data.get(field)
+        if field == 'method' and value:
+            value = value.upper()
+        parts[field] = value
+
+    # Header names are case-insensitive, so match them that way
+    headers = {key.lower(): value for key, value in (request_data.get('headers') or {}).items()}
+    parts['headers'] = {name.lower(): headers.get(name.lower()) for name in config.get('headers', [])}
+
+    # Sorting keys normalizes JSON payloads that differ only in key order
+    normalized = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class FingerprintIndex:
+    """Bounded map of recent fingerprints to the capture they first arrived as"""
+
+    def __init__(self, max_entries=MAX_INDEX_ENTRIES):
+        self.max_entries = max_entries
+        # (session_id, fingerprint) -> (doc_id, expires_at), oldest first
+        self.entries = OrderedDict()
+
+    def get(self, session_id, fp, now=None):
+        """Get the doc_id of the original capture, or None if unseen or expired"""
+        now = time.time() if now is None else now
+        key = (session_id, fp)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        doc_id, expires_at = entry
+        if expires_at <= now:
+            del self.entries[key]
+            return None
+        return doc_id
+
+    def add(self, session_id, fp, doc_id, window_seconds, now=None):
+        """Remember a new original capture"""
+        now = time.time() if now is None else now
+        key = (session_id, fp)
+        self.entries.pop(key, None)
+        self.entries[key] = (doc_id, now + window_seconds)
+
+        # Entries are added in time order, so the oldest ones go first
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def discard_session(self, session_id):
+        """Forget every fingerprint of a session"""
+        for key in [key for key in self.entries if key[0] == session_id]:
+            del self.entries[key]
+
+
+def normalize_dedup_config(raw_config):
+    """Validate a dedup config sent by the client, raising ValueError when invalid"""
+    if not isinstance(raw_config, dict):
+        raise ValueError('dedup config must be an object')
+
+    config = dict(DEFAULT_DEDUP_CONFIG)
+    config['enabled'] = bool(raw_config.get('enabled', False))
+
+    if 'fields' in raw_config:
+        fields = raw_config['fields']
+        if not isinstance(fields, list) or any(field not in FINGERPRINT_FIELDS for field in fields):
+            raise ValueError(f'fields must be a list of: {", ".join(FINGERPRINT_FIELDS)}')
+        config['fields'] = fields
+
+    if 'headers' in raw_config:
+        if not isinstance(raw_config['headers'], list):
+            raise ValueError('headers must be a list')
+        config['headers'] = [str(name) for name in raw_config['headers']]
+
+    if not config['fields'] and not config['headers']:
+        raise ValueError('At least one field or header is required')
+
+    if 'window_seconds' in raw_config:
+        try:
+            config['window_seconds'] = int(raw_config['window_seconds'])
+        except (TypeError, ValueError):
+            raise ValueError('window_seconds must be a number')
+        if config['window_seconds'] <= 0:
+            raise ValueError('window_seconds must be positive')
+
+    return config
@@ -0,0 +1,149 @@
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlencode, urlparse
+import requests
+from requests.adapters import HTTPAdapter
+
+# Headers that are never forwarded to a target
+SKIPPED_HEADERS = ['host', 'content-length', 'connection', 'accept-encoding', 'content-encoding']
+
+# Methods that are forwarded without a body
+BODYLESS_METHODS = ['GET', 'DELETE', 'OPTIONS']
+KNOWN_METHODS = ['GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS']
+
+DEFAULT_TIMEOUT = 10
+MAX_WORKERS = 16
+
+
+class Forwarder:
+    """Forwards captured requests to one or more targets concurrently"""
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='forwarder')
+
+        # Share one pooled HTTP client so repeated forwards reuse connections
+        self.http = requests.Session()
+        # Forwards are stateless: never store cookies set by one target and
+        # replay them on later forwards for other users and sessions
+        self.http.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.http.mount('http://', adapter)
+        self.http.mount('https://', adapter)
+
+    def forward(self, targets, request_data):
+        """Send request data to all targets at once and return one result per target"""
+        futures = [self.executor.submit(self.forward_one, target, request_data) for target in targets]
+        return [future.result() for future in futures]
+
+    def forward_one(self, target, request_data):
+        """Send request data to a single target"""
+        original_method = (request_data.get('method', 'POST')).upper()
+        method = original_method if original_method in KNOWN_METHODS else 'POST'
+
+        # Handle query parameters
+        final_url = target['url']
+        original_query_params = request_data.get('query_params', {})
+        if original_query_params:
+            separator = '&' if '?' in final_url else '?'
+            final_url = f"{final_url}{separator}{urlencode(original_query_params)}"
+
+        request_options = {
+            'headers': self._filter_headers(target, request_data.get('headers', {})),
+            'timeout': target.get('timeout') or DEFAULT_TIMEOUT
+        }
+
+        # Handle payload
+        payload = request_data.get('payload')
+        if method not in BODYLESS_METHODS and payload is not None:
+            if isinstance(payload, dict):
+                request_options['json'] = payload
+            elif isinstance(payload, str):
+                # Send string payload as raw data without JSON parsing
+                request_options['data'] = payload
+            else:
+                request_options['data'] = str(payload)
+
+        try:
+            response = self.http.request(method, final_url, **request_options)
+        except requests.exceptions.RequestException as e:
+            return {
+                'target_url': target['url'],
+                'error': str(e),
+                'success': False,
+                'method_used': original_method
+            }
+
+        # Process response
+        try:
+            response_text = response.text  # Get full response text
+        except Exception:
+            response_text = "Unable to read response text"
+
+        return {
+            'target_url': target['url'],
+            'status_code': response.status_code,
+            'response_text': response_text,
+            'success': response.status_code < 400,
+            'method_used': original_method,
+            'redirect_url': final_url,
+            'response_headers': dict(response.headers),
+            'elapsed_ms': int(response.elapsed.total_seconds() * 1000)
+        }
+
+    def _filter_headers(self, target, original_headers):
+        """Apply the default and per-target header filters"""
+        include = [name.lower() for name in target.get('include_headers', [])]
+        exclude = SKIPPED_HEADERS + [name.lower() for name in target.get('exclude_headers', [])]
+
+        headers = {}
+        for key, value in original_headers.items():
+            if key.lower() in exclude:
+                continue
+            if include and key.lower() not in include:
+                continue
+            headers[key] = value
+        return headers
+
+
+def normalize_forward_targets(raw_targets):
+    """Validate forward targets sent by the client, raising ValueError when invalid"""
+    if not isinstance(raw_targets, list):
+        raise ValueError('forward_targets must be a list')
+
+    targets = []
+    for raw in raw_targets:
+        if isinstance(raw, str):
+            raw = {'url': raw}
+        if not isinstance(raw, dict) or not isinstance(raw.get('url'), str) or not raw['url'].strip():
+            raise ValueError('Each forward target needs a url')
+
+        target = {'url': raw['url'].strip()}
+        parsed = urlparse(target['url'])
+        if parsed.scheme not in ('http', 'https') or not parsed.netloc:
+            raise ValueError('Forward target urls must start with http:// or https://')
+
+        if raw.get('timeout') is not None:
+            try:
+                target['timeout'] = float(raw['timeout'])
+            except (TypeError, ValueError):
+                raise ValueError('timeout must be a number')
+            if target['timeout'] <= 0:
+                raise ValueError('timeout must be positive')
+
+        for key in ('include_headers', 'exclude_headers'):
+            if raw.get(key):
+                if not isinstance(raw[key], list):
+                    raise ValueError(f'{key} must be a list')
+                target[key] = [str(name) for name in raw[key]]
+
+        targets.append(target)
+
+    return targets
+
+
+def session_forward_targets(session_data):
+    """Get the targets for a session, falling back to its single redirect URL"""
+    targets = session_data.get('forward_targets') or []
+    if not targets and session_data.get('redirect_url'):
+        targets = [{'url': session_data['redirect_url']}]
+    return targets
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Offline maintenance commands for the webhook callback viewer.
+Stop the server before running any of these.
+"""
+
+import argparse
+import os
+import sys
+
+from database import DatabaseManager, reshard
+from transfer import encode_ndjson, import_stream
+
+
+def reshard_command(args):
+    """Move stored sessions to a different number of shards"""
+    try:
+        sessions, requests = reshard(args.db_path, args.old_shards, args.new_shards,
+                                     args.remove_old, args.force)
+    except ValueError as e:
+        sys.exit(f'{e} (use --force to overwrite them)')
+    print(f"Moved {sessions} sessions and {requests} requests "
+          f"from {args.old_shards} to {args.new_shards} shard(s)")
+
+
+def open_database(args):
+    return DatabaseManager(args.db_path, args.shards)
+
+
+def export_command(args):
+    """Write sessions to an NDJSON file (or stdout)"""
+    db = open_database(args)
+    if args.session:
+        if not args.user:
+            sys.exit('--user is required with --session')
+        records = db.export_records(args.session, args.user)
+    else:
+        records = db.export_records()
+
+    compress = args.gzip or args.output.endswith('.gz')
+    output = sys.stdout.buffer if args.output == '-' else open(args.output, 'wb')
+    try:
+        for chunk in encode_ndjson(records, compress=compress):
+            output.write(chunk)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+
+
+def import_command(args):
+    """Load sessions from an NDJSON file (or stdin)"""
+    db = open_database(args)
+    compressed = args.gzip or args.input.endswith('.gz')
+    source = sys.stdin.buffer if args.input == '-' else open(args.input, 'rb')
+    try:
+        counts = import_stream(db, source, compressed=compressed, batch_size=args.batch_size)
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+    print(f"Imported {counts['sessions']} sessions and {counts['requests']} requests")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--db-path', default='data/db.json', help='Base database path')
+    parser.add_argument('--shards', type=int, default=int(os.environ.get('DB_SHARDS', 1)),
+                        help='Shard count of the database (defaults to DB_SHARDS)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    reshard_parser = subparsers.add_parser('reshard', help='Redistribute sessions across shards')
+    reshard_parser.add_argument('--from', dest='old_shards', type=int, required=True,
+                                help='Current shard count (1 for a single db.json)')
+    reshard_parser.add_argument('--to', dest='new_shards', type=int, required=True,
+                                help='New shard count (1 for a single db.json)')
+    reshard_parser.add_argument('--remove-old', action='store_true',
+                                help='Delete the old shard files once copied')
+    reshard_parser.add_argument('--force', action='store_true',
+                                help='Overwrite target shard files that already hold data')
+    reshard_parser.set_defaults(func=reshard_command)
+
+    export_parser = subparsers.add_parser('export', help='Export sessions as NDJSON')
+    export_parser.add_argument('--output', default='-', help='Output file, - for stdout')
+    export_parser.add_argument('--session', help='Export only this session')
+    export_parser.add_argument('--user', help='Owner of the session given with --session')
+    export_parser.add_argument('--gzip', action='store_true', help='Gzip the output')
+    export_parser.set_defaults(func=export_command)
+
+    import_parser = subparsers.add_parser('import', help='Import sessions from NDJSON')
+    import_parser.add_argument('--input', default='-', help='Input file, - for stdin')
+    import_parser.add_argument('--gzip', action='store_true', help='Input is gzipped')
+    import_parser.add_argument('--batch-size', type=int, default=500, help='Records per write')
+    import_parser.set_defaults(func=import_command)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
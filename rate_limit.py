@@ -0,0 +1,76 @@
+from collections import Counter, OrderedDict
+import threading
+import time
+
+# Most keys (sessions or addresses) tracked at once; the least recently seen are dropped
+MAX_TRACKED_KEYS = 10000
+
+
+class RateLimiter:
+    """Token bucket rate limiter keyed by session ID or remote address"""
+
+    def __init__(self, rate, burst, max_keys=MAX_TRACKED_KEYS):
+        # rate is tokens per second, burst is the bucket size; a rate of 0 disables limiting
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_keys = max_keys
+        # key -> (tokens, last refill time), least recently used first
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def allow(self, key, now=None):
+        """Take a token for a key, returning (allowed, seconds until the next token)"""
+        if not self.enabled:
+            return True, 0
+
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+
+            if tokens >= 1:
+                allowed, retry_after = True, 0
+                tokens -= 1
+            else:
+                allowed, retry_after = False, (1 - tokens) / self.rate
+
+            self.buckets[key] = (tokens, now)
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+
+        return allowed, retry_after
+
+
+class RejectionStats:
+    """Counts rejected requests by reason and key"""
+
+    def __init__(self, max_keys=MAX_TRACKED_KEYS):
+        self.max_keys = max_keys
+        self.totals = Counter()
+        self.by_key = {}
+        self.lock = threading.Lock()
+
+    def record(self, reason, key):
+        """Count one rejection"""
+        with self.lock:
+            self.totals[reason] += 1
+            counts = self.by_key.setdefault(reason, Counter())
+            counts[key] += 1
+            if len(counts) > self.max_keys:
+                # Keep the heaviest offenders
+                self.by_key[reason] = Counter(dict(counts.most_common(self.max_keys // 2)))
+
+    def snapshot(self, top=50):
+        """Get the totals and the most rejected keys for each reason"""
+        with self.lock:
+            return {
+                'totals': dict(self.totals),
+                'top': {
+                    reason: [{'key': key, 'count': count} for key, count in counts.most_common(top)]
+                    for reason, counts in self.by_key.items()
+                }
+            }
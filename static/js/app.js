@@ -594,7 +594,8 @@ function SessionDetail({ sessionId, onBack, onNameUpdate }) {
     const [session, setSession] = useState(null);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState(null);
-    const [previousRequestCount, setPreviousRequestCount] = useState(0);
+    const [previousLatestOrder, setPreviousLatestOrder] = useState(0);
+    const [previousDuplicateTotal, setPreviousDuplicateTotal] = useState(0);
     const [isInitialLoad, setIsInitialLoad] = useState(true);
     const [selectedRequest, setSelectedRequest] = useState(null);
     const [allSessions, setAllSessions] = useState([]);
@@ -661,7 +662,8 @@ function SessionDetail({ sessionId, onBack, onNameUpdate }) {
             
             // Set initial request count and select first request if none selected
             if (isInitialLoad) {
-                setPreviousRequestCount(newSession.requests ? newSession.requests.length : 0);
+                setPreviousLatestOrder(getLatestInsertionOrder(newSession.requests));
+                setPreviousDuplicateTotal(getDuplicateTotal(newSession.requests));
                 setIsInitialLoad(false);
                 if (newSession.requests && newSession.requests.length > 0 && !selectedRequest) {
                     // Sort requests by timestamp (newest first) and select the first one
@@ -678,15 +680,32 @@ function SessionDetail({ sessionId, onBack, onNameUpdate }) {
         }
     };
     
+    // Highest insertion order in a request list; unlike the length it keeps
+    // growing once the server starts trimming sessions to the 20 newest requests
+    const getLatestInsertionOrder = (requestList) => {
+        return (requestList || []).reduce(
+            (latest, req) => Math.max(latest, (req && req.insertion_order) || 0), 0
+        );
+    };
+    
+    // Redeliveries collapsed into existing requests don't add to the list,
+    // so count them separately to notice new ones
+    const getDuplicateTotal = (requestList) => {
+        return (requestList || []).reduce(
+            (total, req) => total + ((req && req.duplicate_count) || 0), 0
+        );
+    };
+    
     // Simple function to check for new requests and update only the left menu
     const checkForNewRequests = async () => {
         try {
             const data = await api.getSessionRequests(sessionId);
             const newRequests = data.requests || [];
-            const currentRequestCount = newRequests.length;
+            const latestOrder = getLatestInsertionOrder(newRequests);
+            const duplicateTotal = getDuplicateTotal(newRequests);
             
-            // Check if there are new requests
-            if (currentRequestCount > previousRequestCount) {
+            // Check if there are new requests or redeliveries
+            if (latestOrder > previousLatestOrder || duplicateTotal !== previousDuplicateTotal) {
                 // Update requests list (left menu only)
                 setRequests(newRequests);
                 
@@ -701,8 +720,9 @@ function SessionDetail({ sessionId, onBack, onNameUpdate }) {
                     }
                 }
                 
-                // Update request count
-                setPreviousRequestCount(currentRequestCount);
+                // Remember the newest request and redelivery count seen
+                setPreviousLatestOrder(latestOrder);
+                setPreviousDuplicateTotal(duplicateTotal);
             }
         } catch (err) {
             console.error('Error checking for new requests:', err);
@@ -776,6 +796,9 @@ function SessionDetail({ sessionId, onBack, onNameUpdate }) {
     }
     
     const webhookUrl = `${window.location.origin}/api/callback/${sessionId}`;
+    // Forward targets take over from the single redirect URL when set
+    const forwardTargets = session.forward_targets || [];
+    const canSend = forwardTargets.length > 0 || !!session.redirect_url;
     
     try {
         return (
@@ -880,6 +903,7 @@ function SessionDetail({ sessionId, onBack, onNameUpdate }) {
                                             }
                                         }}
                                         placeholder="https://example.com/webhook"
+                                        disabled={forwardTargets.length > 0}
                                     />
                                     <button 
                                         className="btn btn-outline-secondary" 
@@ -898,7 +922,7 @@ function SessionDetail({ sessionId, onBack, onNameUpdate }) {
                                         className="btn btn-outline-primary" 
                                         type="button"
                                         onClick={async () => {
-                                            if (!session.redirect_url) {
+                                            if (!canSend) {
                                                 alert('Please set a redirect URL first');
                                                 return;
                                             }
@@ -923,11 +947,21 @@ function SessionDetail({ sessionId, onBack, onNameUpdate }) {
                                                 setShowRedirectResult(true);
                                             }
                                         }}
-                                        disabled={!session.redirect_url || !selectedRequest}
+                                        disabled={!canSend || !selectedRequest}
                                     >
                                         <i className="fas fa-paper-plane"></i> Send
                                     </button>
                                 </div>
+                                {forwardTargets.length > 0 && (
+                                    <div className="mt-2 small" style={{ color: '#b0b0b0' }}>
+                                        Sending to {forwardTargets.length} forward target{forwardTargets.length === 1 ? '' : 's'} (redirect URL unused):
+                                        <ul className="mb-0">
+                                            {forwardTargets.map((target, index) => (
+                                                <li key={index} style={{ wordBreak: 'break-all' }}>{target.url}</li>
+                                            ))}
+                                        </ul>
+                                    </div>
+                                )}
                             </div>
                         </div>
                     </div>
@@ -982,7 +1016,37 @@ function SessionDetail({ sessionId, onBack, onNameUpdate }) {
                             maxHeight: '400px',
                             overflow: 'auto'
                         }}>
-                            {redirectResult.success && redirectResult.response_text ? (
+                            {redirectResult.results && redirectResult.results.length > 1 ? (
+                                redirectResult.results.map((result, index) => (
+                                    <div key={index} className="mb-3">
+                                        <div className="mb-1" style={{ color: 'white', wordBreak: 'break-all' }}>
+                                            <i className={`fas ${result.success ? 'fa-check-circle text-success' : 'fa-exclamation-circle text-danger'}`}></i>
+                                            {' '}{result.target_url}
+                                            {result.status_code !== undefined && (
+                                                <span className="badge bg-secondary ms-2">{result.status_code}</span>
+                                            )}
+                                        </div>
+                                        {result.response_text ? (
+                                            <pre className="mb-0" style={{ 
+                                                whiteSpace: 'pre-wrap', 
+                                                wordBreak: 'break-word', 
+                                                fontSize: '0.875rem',
+                                                color: '#e0e0e0',
+                                                backgroundColor: '#011a1f',
+                                                padding: '1rem',
+                                                borderRadius: '0.375rem',
+                                                border: '1px solid #055a64'
+                                            }}>
+                                                {result.response_text}
+                                            </pre>
+                                        ) : (
+                                            <div className="text-danger">
+                                                {result.error || 'No response data'}
+                                            </div>
+                                        )}
+                                    </div>
+                                ))
+                            ) : redirectResult.success && redirectResult.response_text ? (
                                 <div className="response-text">
                                     <pre className="mb-0" style={{ 
                                         whiteSpace: 'pre-wrap', 
@@ -1048,6 +1112,14 @@ function SessionDetail({ sessionId, onBack, onNameUpdate }) {
                                                 year: 'numeric'
                                             })}
                                         </span>
+                                        {request.duplicate_count > 0 && (
+                                            <span
+                                                className="badge bg-secondary request-duplicates"
+                                                title={`Redelivered ${request.duplicate_count} more time(s)`}
+                                            >
+                                                &times;{request.duplicate_count + 1}
+                                            </span>
+                                        )}
                                     </div>
                                 ))
                         )}
@@ -24,7 +24,7 @@ class RedirectManager {
             
             for (const [key, value] of Object.entries(originalHeaders)) {
                 // Skip headers that shouldn't be forwarded
-                if (!['host', 'content-length', 'connection', 'accept-encoding'].includes(key.toLowerCase())) {
+                if (!['host', 'content-length', 'connection', 'accept-encoding', 'content-encoding'].includes(key.toLowerCase())) {
                     headers[key] = value;
                 }
             }
@@ -0,0 +1,399 @@
+"""
+Behaviour checks for the webhook callback viewer.
+These use Flask's test client and a temporary database, so no server needs to be running.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+
+# webhook.py opens its database on import, so keep that away from data/db.json
+os.environ.setdefault('DB_PATH', os.path.join(tempfile.mkdtemp(), 'db.json'))
+
+import webhook
+from database import DatabaseManager, reshard, shard_index, shard_paths
+from rate_limit import RateLimiter, RejectionStats
+from transfer import decode_ndjson
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Give every test its own empty database"""
+    database = DatabaseManager(str(tmp_path / 'data' / 'db.json'))
+    monkeypatch.setattr(webhook, 'db', database)
+    return database
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    # Fresh limits so earlier tests don't use up the buckets
+    monkeypatch.setattr(webhook, 'session_limiter', RateLimiter(10, 50))
+    monkeypatch.setattr(webhook, 'source_limiter', RateLimiter(20, 100))
+    monkeypatch.setattr(webhook, 'rejection_stats', RejectionStats())
+    return webhook.app.test_client()
+
+
+def new_session(client):
+    return client.post('/api/generate-session').get_json()['session_id']
+
+
+@pytest.fixture
+def target_server():
+    """Local HTTP server that records forwarded requests and sets a cookie"""
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            record = {'path': self.path, 'headers': dict(self.headers), 'body': body, 'arrived': time.monotonic()}
+            received.append(record)
+            time.sleep(0.3)
+            record['replied'] = time.monotonic()
+            self.send_response(200)
+            self.send_header('Set-Cookie', 'sid=SECRET; Path=/')
+            self.end_headers()
+            self.wfile.write(b'ok')
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}', received
+    server.shutdown()
+
+
+# Sharded storage
+
+def test_sessions_are_routed_to_shards_by_session_id(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'db.json'), shards=4)
+    session_ids = [db.create_session('user-1') for _ in range(12)]
+    db.copy_session_to_user(session_ids[0], 'user-2')
+
+    for session_id in session_ids:
+        shard = db.shards[shard_index(session_id, 4)]
+        assert shard.sessions_table.count(db.Query.session_id == session_id) >= 1
+
+    assert {s['session_id'] for s in db.get_user_sessions('user-1')} == set(session_ids)
+    assert [s['session_id'] for s in db.get_user_sessions('user-2')] == [session_ids[0]]
+
+    db.delete_session(session_ids[0], 'user-2')
+    assert db.get_user_sessions('user-2') == []
+
+
+def test_sessions_keep_the_20_newest_requests(db):
+    session_id = db.create_session('user-1')
+    for i in range(25):
+        db.add_request(session_id, 'user-1', {'payload': {'i': i}})
+
+    requests = db.get_session_requests(session_id)
+    assert [r['payload']['i'] for r in requests] == list(range(5, 25))
+    # New requests keep getting higher numbers after trimming starts
+    assert requests[-1]['insertion_order'] == 25
+
+
+def test_reshard_moves_data_and_refuses_to_overwrite(tmp_path):
+    db_path = str(tmp_path / 'db.json')
+    db = DatabaseManager(db_path)
+    session_id = db.create_session('user-1')
+    db.add_request(session_id, 'user-1', {'payload': 'first'})
+
+    assert reshard(db_path, 1, 4) == (1, 1)
+    sharded = DatabaseManager(db_path, shards=4)
+    assert [s['session_id'] for s in sharded.get_user_sessions('user-1')] == [session_id]
+    sharded.add_request(session_id, 'user-1', {'payload': 'second'})
+
+    # Running it again would replace the new capture with the stale db.json
+    with pytest.raises(ValueError):
+        reshard(db_path, 1, 4)
+    assert len(sharded.get_session_requests(session_id)) == 2
+
+    assert reshard(db_path, 4, 2, remove_old=True) == (1, 2)
+    assert not any(os.path.exists(path) for path in shard_paths(db_path, 4))
+
+
+# Forwarding to several targets
+
+def test_forwarding_reaches_all_targets_in_parallel(client, target_server):
+    base_url, received = target_server
+    session_id = new_session(client)
+    response = client.put(f'/api/sessions/{session_id}/forward-targets', json={'forward_targets': [
+        {'url': f'{base_url}/staging', 'exclude_headers': ['X-Secret']},
+        {'url': f'{base_url}/recorder', 'include_headers': ['Content-Type']},
+    ]})
+    assert response.status_code == 200
+
+    request_data = {
+        'method': 'POST',
+        'headers': {'Content-Type': 'application/json', 'X-Secret': 's', 'X-Event': 'e'},
+        'payload': {'a': 1}
+    }
+    result = client.post(f'/api/proxy-redirect/{session_id}', json={'request_data': request_data}).get_json()
+
+    assert result['success'] is True
+    assert [r['status_code'] for r in result['results']] == [200, 200]
+    # Serial forwarding would only reach the second target after the first replied
+    assert max(r['arrived'] for r in received) < min(r['replied'] for r in received)
+
+    headers = {r['path']: r['headers'] for r in received}
+    assert 'X-Secret' not in headers['/staging'] and headers['/staging']['X-Event'] == 'e'
+    assert 'X-Event' not in headers['/recorder']
+
+
+def test_forwarding_does_not_replay_cookies_from_targets(client, target_server):
+    base_url, received = target_server
+    session_id = new_session(client)
+    client.put(f'/api/sessions/{session_id}/forward-targets', json={'forward_targets': [base_url]})
+
+    for _ in range(2):
+        client.post(f'/api/proxy-redirect/{session_id}', json={'request_data': {'method': 'POST', 'headers': {}}})
+
+    assert len(received) == 2
+    assert 'Cookie' not in received[1]['headers']
+
+
+@pytest.mark.parametrize('target', [{'url': 5}, {'url': 'ftp://example.com'}, {'url': 'example.com'}, {}])
+def test_invalid_forward_targets_are_rejected(client, target):
+    session_id = new_session(client)
+    response = client.put(f'/api/sessions/{session_id}/forward-targets', json={'forward_targets': [target]})
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+# Duplicate delivery detection
+
+def test_redeliveries_are_collapsed_into_the_original(client):
+    session_id = new_session(client)
+    response = client.put(f'/api/sessions/{session_id}/dedup', json={
+        'enabled': True, 'headers': ['X-Delivery-Id'], 'window_seconds': 60
+    })
+    assert response.status_code == 200
+
+    results = [
+        client.post(f'/api/callback/{session_id}', json=payload, headers={'X-Delivery-Id': delivery_id}).get_json()
+        for payload, delivery_id in [({'a': 1, 'b': 2}, 'd1'), ({'b': 2, 'a': 1}, 'd1'), ({'a': 1, 'b': 2}, 'd2')]
+    ]
+    # Key order doesn't matter, the delivery ID does
+    assert [r['duplicate'] for r in results] == [False, True, False]
+
+    requests = client.get(f'/api/sessions/{session_id}/requests').get_json()['requests']
+    assert len(requests) == 2
+    assert requests[0]['duplicate_count'] == 1
+    assert len(requests[0]['duplicate_timestamps']) == 1
+    assert 'duplicate_count' not in requests[1]
+
+
+def test_duplicates_are_stored_when_dedup_is_off(client):
+    session_id = new_session(client)
+    for _ in range(2):
+        client.post(f'/api/callback/{session_id}', json={'a': 1})
+    assert client.get(f'/api/sessions/{session_id}/requests').get_json()['count'] == 2
+
+
+# Rate limits and body size
+
+def test_session_rate_limit_returns_429(client, monkeypatch):
+    monkeypatch.setattr(webhook, 'session_limiter', RateLimiter(0.1, 2))
+    session_id = new_session(client)
+
+    statuses = [client.post(f'/api/callback/{session_id}', json={'a': 1}).status_code for _ in range(4)]
+    assert statuses == [200, 200, 429, 429]
+
+    response = client.post(f'/api/callback/{session_id}', json={'a': 1})
+    assert int(response.headers['Retry-After']) >= 1
+    # Rejected requests are not stored
+    assert client.get(f'/api/sessions/{session_id}/requests').get_json()['count'] == 2
+
+    stats = client.get('/api/rate-limits').get_json()['rejections']
+    assert stats['totals'] == {'session': 3}
+    assert stats['top']['session'] == [{'key': session_id, 'count': 3}]
+
+
+def test_oversized_bodies_return_413(client):
+    limit = webhook.MAX_CALLBACK_CONTENT_LENGTH
+    session_id = new_session(client)
+
+    response = client.post(f'/api/callback/{session_id}', data=b'x' * (limit + 1))
+    assert response.status_code == 413
+
+    # Chunked bodies have no Content-Length and must be cut off while reading
+    response = client.post(
+        f'/api/callback/{session_id}',
+        input_stream=io.BytesIO(b'x' * (limit + 10)),
+        headers={'Transfer-Encoding': 'chunked', 'Content-Type': 'text/plain'},
+        environ_overrides={'wsgi.input_terminated': True}
+    )
+    assert response.status_code == 413
+
+    response = client.post(
+        f'/api/callback/{session_id}',
+        input_stream=io.BytesIO(b'small'),
+        headers={'Transfer-Encoding': 'chunked', 'Content-Type': 'text/plain'},
+        environ_overrides={'wsgi.input_terminated': True}
+    )
+    assert response.status_code == 200
+    assert response.get_json()['request_data']['payload'] == 'small'
+
+    assert client.get(f'/api/sessions/{session_id}/requests').get_json()['count'] == 1
+
+
+
+def test_captures_near_the_limit_can_still_be_forwarded(client, target_server):
+    base_url, received = target_server
+    session_id = new_session(client)
+    client.put(f'/api/sessions/{session_id}/forward-targets', json={'forward_targets': [base_url]})
+
+    # Quotes get escaped when the payload is sent back as a JSON string,
+    # so the proxy-redirect body ends up larger than the capture itself
+    payload = {'text': '"' * (webhook.MAX_CALLBACK_CONTENT_LENGTH // 2 - 100)}
+    assert client.post(f'/api/callback/{session_id}', json=payload).status_code == 200
+
+    capture = client.get(f'/api/sessions/{session_id}/requests').get_json()['requests'][0]
+    body = json.dumps({'request_data': capture}).encode()
+    assert len(body) > webhook.MAX_CALLBACK_CONTENT_LENGTH
+    response = client.post(
+        f'/api/proxy-redirect/{session_id}', data=body, headers={'Content-Type': 'application/json'}
+    )
+    assert response.status_code == 200
+    assert response.get_json()['success'] is True
+    assert len(received) == 1
+
+
+# Export and import
+
+def test_export_import_round_trip(client, monkeypatch):
+    monkeypatch.setattr(webhook, 'ADMIN_TOKEN', 'secret')
+    session_id = new_session(client)
+    for i in range(3):
+        client.post(f'/api/callback/{session_id}', json={'i': i})
+
+    # Reading the session for display must not change what gets exported
+    client.get(f'/api/sessions/{session_id}/requests')
+
+    response = client.get(f'/api/sessions/{session_id}/export')
+    assert response.mimetype == 'application/x-ndjson'
+    records = list(decode_ndjson(io.BytesIO(response.data)))
+    assert [r['type'] for r in records] == ['session', 'request', 'request', 'request']
+    assert [r['request']['payload'] for r in records[1:]] == [{'i': 0}, {'i': 1}, {'i': 2}]
+
+    assert client.get('/api/admin/export').status_code == 403
+    backup = client.get('/api/admin/export?gzip=1', headers={'X-Admin-Token': 'secret'}).data
+    assert len(list(decode_ndjson(io.BytesIO(gzip.decompress(backup))))) == 4
+
+    client.delete(f'/api/sessions/{session_id}')
+    headers = {'X-Admin-Token': 'secret', 'Content-Encoding': 'gzip'}
+    imported = client.post('/api/admin/import', data=backup, headers=headers).get_json()
+    assert imported['imported'] == {'sessions': 1, 'requests': 3}
+
+    # Importing the same backup again adds nothing
+    imported = client.post('/api/admin/import', data=backup, headers=headers).get_json()
+    assert imported['imported'] == {'sessions': 0, 'requests': 0}
+
+    requests = client.get(f'/api/sessions/{session_id}/requests').get_json()['requests']
+    assert [r['payload'] for r in requests] == ['{"i":0}', '{"i":1}', '{"i":2}']
+
+
+def test_import_keeps_the_20_most_recent_requests(client, monkeypatch):
+    monkeypatch.setattr(webhook, 'ADMIN_TOKEN', 'secret')
+    session_id = new_session(client)
+    lines = [
+        json.dumps({'type': 'request', 'request': {'session_id': session_id, 'insertion_order': i, 'payload': str(i)}})
+        for i in range(1, 26)
+    ]
+    client.post('/api/admin/import', data='\n'.join(lines), headers={'X-Admin-Token': 'secret'})
+
+    requests = client.get(f'/api/sessions/{session_id}/requests').get_json()['requests']
+    assert sorted(r['insertion_order'] for r in requests) == list(range(6, 26))
+
+
+@pytest.mark.parametrize('line', [
+    b'{not json',
+    b'{"type":"session","session":{"session_id":"abc","user_id":"u1"}}',
+    b'{"type":"request","request":{"session_id":"abc","payload":"x"}}',
+])
+def test_import_rejects_bad_lines(client, db, monkeypatch, line):
+    monkeypatch.setattr(webhook, 'ADMIN_TOKEN', 'secret')
+    response = client.post('/api/admin/import', data=line + b'\n', headers={'X-Admin-Token': 'secret'})
+    assert response.status_code == 400
+    assert db.get_session_by_id('abc') is None
+
+
+# Compression and conditional responses
+
+def make_old(db, session_id):
+    """Move a session's last_updated out of the current second so Last-Modified is sent"""
+    shard = db._shard(session_id)
+    shard.sessions_table.update({'last_updated': '2024-01-01T12:00:00'}, db.Query.session_id == session_id)
+
+
+def test_read_endpoints_answer_if_modified_since(client, db, monkeypatch):
+    session_id = new_session(client)
+    client.post(f'/api/callback/{session_id}', json={'a': 1})
+    make_old(db, session_id)
+
+    for url in (f'/api/sessions/{session_id}', f'/api/sessions/{session_id}/requests'):
+        response = client.get(url)
+        assert response.status_code == 200
+        last_modified = response.headers['Last-Modified']
+        assert client.get(url, headers={'If-Modified-Since': last_modified}).status_code == 304
+
+    # A new capture moves last_updated, so the poll gets the new data
+    client.post(f'/api/callback/{session_id}', json={'a': 2})
+    response = client.get(f'/api/sessions/{session_id}/requests', headers={'If-Modified-Since': last_modified})
+    assert response.status_code == 200
+    assert response.get_json()['count'] == 2
+
+    # So does a request added by an import
+    make_old(db, session_id)
+    last_modified = client.get(f'/api/sessions/{session_id}/requests').headers['Last-Modified']
+    monkeypatch.setattr(webhook, 'ADMIN_TOKEN', 'secret')
+    record = {'type': 'request', 'request': {'session_id': session_id, 'insertion_order': 99, 'payload': 'x'}}
+    response = client.post('/api/admin/import', data=json.dumps(record), headers={'X-Admin-Token': 'secret'})
+    assert response.get_json()['imported']['requests'] == 1
+    response = client.get(f'/api/sessions/{session_id}/requests', headers={'If-Modified-Since': last_modified})
+    assert response.status_code == 200
+    assert response.get_json()['count'] == 3
+
+    stats = client.get('/api/response-stats').get_json()['endpoints']
+    assert stats['get_session_requests']['not_modified'] == 1
+
+
+def test_large_json_responses_are_gzipped_when_accepted(client):
+    session_id = new_session(client)
+    client.post(f'/api/callback/{session_id}', json={'pad': 'x' * 2000})
+
+    url = f'/api/sessions/{session_id}/requests'
+    plain = client.get(url)
+    assert 'Content-Encoding' not in plain.headers
+
+    compressed = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert gzip.decompress(compressed.data) == plain.data
+    assert len(compressed.data) < len(plain.data)
+
+    # Small responses are not worth compressing
+    small = client.get('/api/sessions/missing', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in small.headers
+
+
+def test_gzip_capture_payloads_are_decompressed(client):
+    session_id = new_session(client)
+    response = client.post(
+        f'/api/callback/{session_id}',
+        data=gzip.compress(b'{"event":"user.created"}'),
+        headers={'Content-Encoding': 'gzip', 'Content-Type': 'application/json'}
+    )
+    assert response.get_json()['request_data']['payload'] == '{"event":"user.created"}'
+
+    # The decompressed size counts against the limit too
+    bomb = gzip.compress(b'0' * (webhook.MAX_CALLBACK_CONTENT_LENGTH + 1))
+    response = client.post(f'/api/callback/{session_id}', data=bomb, headers={'Content-Encoding': 'gzip'})
+    assert response.status_code == 413
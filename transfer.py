@@ -0,0 +1,94 @@
+import json
+import zlib
+
+# Records written per database call when importing
+IMPORT_BATCH_SIZE = 500
+
+# Bytes read from an import stream at a time
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def encode_ndjson(records, compress=False):
+    """Turn records into NDJSON chunks, optionally gzip compressed"""
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    for record in records:
+        line = (json.dumps(record, separators=(',', ':')) + '\n').encode('utf-8')
+        if compressor:
+            line = compressor.compress(line)
+            if not line:
+                continue
+        yield line
+    if compressor:
+        yield compressor.flush()
+
+
+def iter_chunks(stream, compressed=False):
+    """Read a binary stream in chunks, decompressing gzip on the fly"""
+    # wbits=47 accepts both gzip and zlib headers
+    decompressor = zlib.decompressobj(wbits=47) if compressed else None
+    while True:
+        chunk = stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        if not decompressor:
+            yield chunk
+            continue
+        # Cap each output chunk so highly compressed input can't expand all at once
+        while chunk:
+            output = decompressor.decompress(chunk, READ_CHUNK_SIZE)
+            if output:
+                yield output
+            chunk = decompressor.unconsumed_tail
+    if decompressor:
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+
+
+def decode_ndjson(stream, compressed=False):
+    """Read records from an NDJSON stream, raising ValueError on a bad line"""
+    buffer = b''
+    line_number = 0
+    for chunk in iter_chunks(stream, compressed):
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            line_number += 1
+            record = _decode_line(line, line_number)
+            if record is not None:
+                yield record
+    record = _decode_line(buffer, line_number + 1)
+    if record is not None:
+        yield record
+
+
+def _decode_line(line, line_number):
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        raise ValueError(f'Invalid JSON on line {line_number}: {e}')
+    if not isinstance(record, dict) or record.get('type') not in ('session', 'request'):
+        raise ValueError(f'Unknown record on line {line_number}')
+    return record
+
+
+def import_stream(db, stream, compressed=False, batch_size=IMPORT_BATCH_SIZE):
+    """Import an NDJSON export into the database in batches, returning the counts"""
+    totals = {'sessions': 0, 'requests': 0}
+    batch = []
+    for record in decode_ndjson(stream, compressed):
+        batch.append(record)
+        if len(batch) >= batch_size:
+            _add_counts(totals, db.import_records(batch))
+            batch = []
+    if batch:
+        _add_counts(totals, db.import_records(batch))
+    return totals
+
+
+def _add_counts(totals, counts):
+    for key, value in counts.items():
+        totals[key] += value
@@ -1,21 +1,121 @@
-from flask import Flask, request, jsonify, render_template, session, redirect, send_file
+from flask import Flask, Request, Response, request, jsonify, render_template, session, redirect, send_file
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
+import hmac
 import json
+import math
 import uuid
-import requests
+import zlib
 
-from datetime import datetime
+from datetime import datetime, timezone
+import io
+from urllib.parse import parse_qsl
 import os
+from compression import ResponseStats, available_encodings, compress
 from database import DatabaseManager
+from dedup import DEFAULT_DEDUP_CONFIG, normalize_dedup_config
+from forwarder import Forwarder, normalize_forward_targets, session_forward_targets
+from rate_limit import RateLimiter, RejectionStats
+from transfer import encode_ndjson, import_stream, iter_chunks
 from user_session import UserSessionManager
 
+class LimitedRequest(Request):
+    """Request that caps the body size of callbacks only"""
+
+    @property
+    def max_content_length(self):
+        # Other endpoints carry captures back (proxy-redirect) or whole backups
+        # (import), which can be larger than the capture that was accepted
+        if self.endpoint == 'callback_endpoint':
+            return MAX_CALLBACK_CONTENT_LENGTH or None
+        return None
+
 app = Flask(__name__)
+app.request_class = LimitedRequest
 app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production')
 CORS(app)
 
 # Initialize database and user session managers
-db = DatabaseManager()
+db = DatabaseManager(
+    os.environ.get('DB_PATH', 'data/db.json'),
+    shards=int(os.environ.get('DB_SHARDS', 1))
+)
 user_manager = UserSessionManager()
+forwarder = Forwarder()
+
+# Callback limits (a rate of 0 disables that limit)
+MAX_CALLBACK_CONTENT_LENGTH = int(os.environ.get('MAX_CALLBACK_CONTENT_LENGTH', 1024 * 1024))
+session_limiter = RateLimiter(
+    float(os.environ.get('SESSION_RATE_LIMIT', 10)),
+    int(os.environ.get('SESSION_RATE_BURST', 50))
+)
+source_limiter = RateLimiter(
+    float(os.environ.get('SOURCE_RATE_LIMIT', 20)),
+    int(os.environ.get('SOURCE_RATE_BURST', 100))
+)
+rejection_stats = RejectionStats()
+
+# Admin endpoints are disabled unless a token is configured
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+# JSON responses smaller than this are sent uncompressed
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+response_stats = ResponseStats()
+
+@app.after_request
+def compress_response(response):
+    """Compress large JSON responses and track bytes sent per endpoint"""
+    if response.status_code == 304:
+        response_stats.record(request.endpoint, 0, 0, not_modified=True)
+        return response
+    
+    if (response.mimetype != 'application/json' or response.direct_passthrough
+            or response.is_streamed or 'Content-Encoding' in response.headers):
+        return response
+    
+    data = response.get_data()
+    encoding = request.accept_encodings.best_match(available_encodings())
+    if encoding and len(data) >= COMPRESS_MIN_SIZE:
+        response.set_data(compress(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    
+    response_stats.record(
+        request.endpoint, len(data), response.content_length,
+        compressed='Content-Encoding' in response.headers
+    )
+    return response
+
+def session_last_modified(session_data):
+    """Get the Last-Modified time of a session, or None if it can't be used safely yet"""
+    if not session_data or not session_data.get('last_updated'):
+        return None
+    
+    # last_updated is naive local time; HTTP dates are UTC with whole seconds
+    last_modified = datetime.fromisoformat(session_data['last_updated']).astimezone(timezone.utc)
+    last_modified = last_modified.replace(microsecond=0)
+    
+    # A session updated during the current second can change again without its
+    # Last-Modified moving, so only hand it out once that second has passed
+    if last_modified >= datetime.now(timezone.utc).replace(microsecond=0):
+        return None
+    return last_modified
+
+def not_modified_response(last_modified):
+    """Get a 304 response if the client's copy is current, otherwise None"""
+    if last_modified and request.if_modified_since and last_modified <= request.if_modified_since:
+        response = Response(status=304)
+        response.last_modified = last_modified
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return None
+
+def conditional_response(response, last_modified):
+    """Add the headers that make browsers revalidate with If-Modified-Since"""
+    response.headers['Cache-Control'] = 'private, no-cache'
+    if last_modified:
+        response.last_modified = last_modified
+    return response
 
 @app.route('/')
 def index():
@@ -57,6 +157,23 @@ def callback_endpoint(session_id):
     if is_browser_request:
         return redirect(f'/session/{session_id}')
     
+    # Reject oversized and over-limit requests before parsing the body or touching storage
+    rejection = check_callback_limits(session_id)
+    if rejection:
+        return rejection
+    
+    # Decompress gzip bodies as a stream, stopping once they grow past the size limit
+    gzip_body = gzip_error = None
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        try:
+            gzip_body = read_gzip_body(MAX_CALLBACK_CONTENT_LENGTH)
+        except zlib.error as e:
+            gzip_error = e
+        else:
+            if gzip_body is None:
+                rejection_stats.record('content_length', session_id)
+                return payload_too_large()
+    
     # Get user ID from session
     user_id = user_manager.get_user_id()
     
@@ -85,7 +202,11 @@ def callback_endpoint(session_id):
     
     # Capture payload based on content type
     try:
-        if request.is_json:
+        if gzip_error is not None:
+            raise gzip_error
+        elif gzip_body is not None:
+            request_data['payload'] = parse_decompressed_payload(gzip_body)
+        elif request.is_json:
             # Parse JSON manually to preserve key order
             raw_data = request.get_data(as_text=True)
             request_data['payload'] = json.loads(raw_data, object_pairs_hook=dict)
@@ -122,11 +243,99 @@ def callback_endpoint(session_id):
         'request_count': len(requests),
         'share_url': f'{request.host_url.rstrip("/")}/session/{session_id}',
         'redirect_url': redirect_url,
+        'duplicate': 'duplicate_of' in request_data,
         'request_data': response_request_data
     }
     
     return jsonify(response_data), 200
 
+def payload_too_large():
+    """Get the 413 response for a callback body over the size limit"""
+    return jsonify({
+        'error': f'Payload too large (max {MAX_CALLBACK_CONTENT_LENGTH} bytes)'
+    }), 413
+
+def read_gzip_body(limit):
+    """Decompress a gzip request body, returning None if it grows past the limit"""
+    body = bytearray()
+    # get_data() is already capped by the callback size limit and may have been read for the size check
+    for chunk in iter_chunks(io.BytesIO(request.get_data()), compressed=True):
+        body.extend(chunk)
+        if limit and len(body) > limit:
+            return None
+    return bytes(body)
+
+def parse_decompressed_payload(body):
+    """Parse a decompressed callback body the same way as an uncompressed one"""
+    text = body.decode(request.mimetype_params.get('charset', 'utf-8'), errors='replace')
+    if request.is_json:
+        return json.loads(text, object_pairs_hook=dict)
+    if request.mimetype == 'application/x-www-form-urlencoded':
+        return dict(parse_qsl(text, keep_blank_values=True))
+    return text
+
+def check_callback_limits(session_id):
+    """Check body size and rate limits for a callback, returning an error response if rejected"""
+    content_length = request.content_length
+    if MAX_CALLBACK_CONTENT_LENGTH and content_length and content_length > MAX_CALLBACK_CONTENT_LENGTH:
+        rejection_stats.record('content_length', session_id)
+        return payload_too_large()
+    
+    checks = [
+        ('source', source_limiter, request.remote_addr, 'Too many requests from this address'),
+        ('session', session_limiter, session_id, 'Too many requests for this session')
+    ]
+    for reason, limiter, key, message in checks:
+        allowed, retry_after = limiter.allow(key)
+        if not allowed:
+            rejection_stats.record(reason, key)
+            return jsonify({'error': message}), 429, {'Retry-After': str(math.ceil(retry_after))}
+    
+    if streamed_body_too_large():
+        rejection_stats.record('content_length', session_id)
+        return payload_too_large()
+    
+    return None
+
+def streamed_body_too_large():
+    """Check a body sent without Content-Length (e.g. chunked) against the size limit"""
+    if request.content_length is not None or not request.max_content_length:
+        return False
+    
+    # Werkzeug stops reading at the limit without complaint; the body is
+    # cached so the payload parsing below doesn't read it again
+    if len(request.get_data()) < request.max_content_length:
+        return False
+    
+    # Reading past a used up limit raises, which tells us the body was longer
+    # (a body of exactly the limit can't be told apart and is rejected too)
+    try:
+        request.stream.read(1)
+    except RequestEntityTooLarge:
+        return True
+    return False
+
+@app.route('/api/rate-limits', methods=['GET'])
+def get_rate_limits():
+    """Get callback limits and counters of rejected requests"""
+    return jsonify({
+        'limits': {
+            'max_content_length': MAX_CALLBACK_CONTENT_LENGTH,
+            'session': {'rate': session_limiter.rate, 'burst': session_limiter.burst},
+            'source': {'rate': source_limiter.rate, 'burst': source_limiter.burst}
+        },
+        'rejections': rejection_stats.snapshot()
+    })
+
+@app.route('/api/response-stats', methods=['GET'])
+def get_response_stats():
+    """Get bytes sent per endpoint, showing compression and 304 savings"""
+    return jsonify({
+        'encodings': available_encodings(),
+        'compress_min_size': COMPRESS_MIN_SIZE,
+        'endpoints': response_stats.snapshot()
+    })
+
 @app.route('/api/sessions', methods=['GET'])
 def get_sessions():
     """Get all sessions for the current user"""
@@ -155,6 +364,11 @@ def get_session(session_id):
     if not session_data:
         return jsonify({'error': 'Session not found'}), 404
     
+    last_modified = session_last_modified(session_data)
+    not_modified = not_modified_response(last_modified)
+    if not_modified:
+        return not_modified
+    
     # Get requests for this session
     requests = db.get_session_requests(session_id, user_id)
     
@@ -168,15 +382,17 @@ def get_session(session_id):
         'id': session_data['session_id'],
         'name': session_data['name'],
         'redirect_url': session_data.get('redirect_url', ''),
+        'forward_targets': session_data.get('forward_targets', []),
+        'dedup': session_data.get('dedup', DEFAULT_DEDUP_CONFIG),
         'created_at': session_data['created_at'],
         'last_updated': session_data['last_updated'],
         'requests': requests
     }
     
-    return jsonify({
+    return conditional_response(jsonify({
         'session': session_response,
         'share_url': f'{request.host_url.rstrip("/")}/session/{session_id}'
-    })
+    }), last_modified)
 
 @app.route('/api/sessions/<session_id>', methods=['DELETE'])
 def delete_session(session_id):
@@ -233,11 +449,124 @@ def update_redirect_url(session_id):
         'redirect_url': redirect_url
     })
 
+@app.route('/api/sessions/<session_id>/forward-targets', methods=['PUT'])
+def update_forward_targets(session_id):
+    """Update the forward targets for the current user's session"""
+    user_id = user_manager.get_user_id()
+    
+    data = request.get_json()
+    if not data or 'forward_targets' not in data:
+        return jsonify({'error': 'forward_targets is required'}), 400
+    
+    try:
+        forward_targets = normalize_forward_targets(data['forward_targets'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    success = db.update_forward_targets(session_id, user_id, forward_targets)
+    
+    if not success:
+        return jsonify({'error': 'Session not found'}), 404
+    
+    return jsonify({
+        'message': 'Forward targets updated successfully',
+        'forward_targets': forward_targets
+    })
+
+@app.route('/api/sessions/<session_id>/dedup', methods=['PUT'])
+def update_dedup_config(session_id):
+    """Update duplicate delivery detection for a session"""
+    user_id = user_manager.get_user_id()
+    
+    data = request.get_json()
+    if not data:
+        return jsonify({'error': 'Dedup config is required'}), 400
+    
+    try:
+        dedup_config = normalize_dedup_config(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    success = db.update_dedup_config(session_id, user_id, dedup_config)
+    
+    if not success:
+        return jsonify({'error': 'Session not found'}), 404
+    
+    return jsonify({
+        'message': 'Dedup settings updated successfully',
+        'dedup': dedup_config
+    })
+
+def is_admin_request():
+    """Check the admin token sent in the X-Admin-Token header"""
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+def wants_gzip():
+    """Check whether a gzip export or import was requested"""
+    return request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+
+def ndjson_response(records, filename):
+    """Stream records as an NDJSON download"""
+    if wants_gzip():
+        mimetype, filename = 'application/gzip', f'{filename}.ndjson.gz'
+    else:
+        mimetype, filename = 'application/x-ndjson', f'{filename}.ndjson'
+    
+    return Response(
+        encode_ndjson(records, compress=wants_gzip()),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+@app.route('/api/sessions/<session_id>/export', methods=['GET'])
+def export_session(session_id):
+    """Stream a session and its requests as NDJSON"""
+    user_id = user_manager.get_user_id()
+    if not db.session_exists(session_id, user_id):
+        return jsonify({'error': 'Session not found'}), 404
+    
+    return ndjson_response(db.export_records(session_id, user_id), f'session-{session_id}')
+
+@app.route('/api/admin/export', methods=['GET'])
+def export_all_sessions():
+    """Stream every session and request as NDJSON"""
+    if not is_admin_request():
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    return ndjson_response(db.export_records(), f'sessions-{datetime.now().strftime("%Y%m%d-%H%M%S")}')
+
+@app.route('/api/admin/import', methods=['POST'])
+def import_sessions():
+    """Import an NDJSON export streamed in the request body"""
+    if not is_admin_request():
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    compressed = wants_gzip() or request.headers.get('Content-Encoding', '').lower() == 'gzip'
+    try:
+        counts = import_stream(db, request.stream, compressed=compressed)
+    except (ValueError, zlib.error) as e:
+        return jsonify({'error': f'Import failed: {e}'}), 400
+    
+    return jsonify({
+        'message': 'Import completed successfully',
+        'imported': counts
+    })
+
 @app.route('/api/sessions/<session_id>/requests', methods=['GET'])
 def get_session_requests(session_id):
     """Get only the requests for a session (lightweight endpoint for polling)"""
     try:
         user_id = user_manager.get_user_id()
+        
+        # Every copy of a session gets last_updated bumped when a request arrives
+        last_modified = session_last_modified(
+            db.get_session(session_id, user_id) or db.get_session_by_id(session_id)
+        )
+        not_modified = not_modified_response(last_modified)
+        if not_modified:
+            return not_modified
+        
         requests = db.get_session_requests(session_id, user_id)
         
         # Convert payload to JSON string to preserve key order
@@ -245,10 +574,10 @@ def get_session_requests(session_id):
             if 'payload' in req and isinstance(req['payload'], dict):
                 req['payload'] = json.dumps(req['payload'], separators=(',', ':'))
         
-        return jsonify({
+        return conditional_response(jsonify({
             'requests': requests,
             'count': len(requests)
-        }), 200
+        }), last_modified), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -281,6 +610,12 @@ def access_session(session_id):
     
     # Get session data for the user
     session_data = db.get_session(session_id, user_id)
+    
+    last_modified = session_last_modified(session_data)
+    not_modified = not_modified_response(last_modified)
+    if not_modified:
+        return not_modified
+    
     requests = db.get_session_requests(session_id, user_id)
     
     # Convert payload to JSON string to preserve key order
@@ -293,16 +628,18 @@ def access_session(session_id):
         'id': session_data['session_id'],
         'name': session_data['name'],
         'redirect_url': session_data.get('redirect_url', ''),
+        'forward_targets': session_data.get('forward_targets', []),
+        'dedup': session_data.get('dedup', DEFAULT_DEDUP_CONFIG),
         'created_at': session_data['created_at'],
         'last_updated': session_data['last_updated'],
         'requests': requests
     }
     
-    return jsonify({
+    return conditional_response(jsonify({
         'session': session_response,
         'share_url': f'{request.host_url.rstrip("/")}/session/{session_id}',
         'message': 'Session accessed successfully'
-    })
+    }), last_modified)
 
 @app.route('/api/redirect/<session_id>', methods=['POST'])
 def handle_redirect(session_id):
@@ -333,15 +670,15 @@ def handle_redirect(session_id):
 
 @app.route('/api/proxy-redirect/<session_id>', methods=['POST'])
 def proxy_redirect(session_id):
-    """Server-side proxy to handle redirects and avoid CORS issues"""
+    """Server-side proxy that forwards a request to every target of the session at once"""
     user_id = user_manager.get_user_id()
     session_data = db.get_session(session_id, user_id)
     
     if not session_data:
         return jsonify({'error': 'Session not found'}), 404
     
-    redirect_url = session_data.get('redirect_url')
-    if not redirect_url:
+    targets = session_forward_targets(session_data)
+    if not targets:
         return jsonify({'error': 'No redirect URL configured'}), 400
     
     # Get request data from the request body
@@ -351,112 +688,18 @@ def proxy_redirect(session_id):
     
     request_data = data['request_data']
     
-    try:
-        # Get the original method from request data
-        original_method = (request_data.get('method', 'POST')).upper()
-        
-        # Get original headers (excluding some that shouldn't be forwarded)
-        original_headers = request_data.get('headers', {})
-        headers = {}
-        
-        for key, value in original_headers.items():
-            # Skip headers that shouldn't be forwarded
-            if key.lower() not in ['host', 'content-length', 'connection', 'accept-encoding']:
-                headers[key] = value
-        
-        # Handle query parameters
-        original_query_params = request_data.get('query_params', {})
-        final_url = redirect_url
-        
-        if original_query_params:
-            # Add query parameters to URL
-            from urllib.parse import urlencode
-            query_string = urlencode(original_query_params)
-            separator = '&' if '?' in final_url else '?'
-            final_url = f"{final_url}{separator}{query_string}"
-        
-        # Prepare request options
-        request_options = {
-            'headers': headers,
-            'timeout': 10  # 10 seconds timeout
-        }
-        
-        # Handle different HTTP methods
-        if original_method == 'GET':
-            response = requests.get(final_url, **request_options)
-        elif original_method == 'POST':
-            # Handle payload
-            payload = request_data.get('payload')
-            if payload is not None:
-                if isinstance(payload, dict):
-                    request_options['json'] = payload
-                elif isinstance(payload, str):
-                    # Send string payload as raw data without JSON parsing
-                    request_options['data'] = payload
-                else:
-                    request_options['data'] = str(payload)
-            response = requests.post(final_url, **request_options)
-        elif original_method == 'PUT':
-            payload = request_data.get('payload')
-            if payload is not None:
-                if isinstance(payload, dict):
-                    request_options['json'] = payload
-                elif isinstance(payload, str):
-                    # Send string payload as raw data without JSON parsing
-                    request_options['data'] = payload
-                else:
-                    request_options['data'] = str(payload)
-            response = requests.put(final_url, **request_options)
-        elif original_method == 'PATCH':
-            payload = request_data.get('payload')
-            if payload is not None:
-                if isinstance(payload, dict):
-                    request_options['json'] = payload
-                elif isinstance(payload, str):
-                    # Send string payload as raw data without JSON parsing
-                    request_options['data'] = payload
-                else:
-                    request_options['data'] = str(payload)
-            response = requests.patch(final_url, **request_options)
-        elif original_method == 'DELETE':
-            response = requests.delete(final_url, **request_options)
-        elif original_method == 'OPTIONS':
-            response = requests.options(final_url, **request_options)
-        else:
-            # Default to POST
-            payload = request_data.get('payload')
-            if payload is not None:
-                if isinstance(payload, dict):
-                    request_options['json'] = payload
-                elif isinstance(payload, str):
-                    # Send string payload as raw data without JSON parsing
-                    request_options['data'] = payload
-                else:
-                    request_options['data'] = str(payload)
-            response = requests.post(final_url, **request_options)
-        
-        # Process response
-        try:
-            response_text = response.text  # Get full response text
-        except:
-            response_text = "Unable to read response text"
-        
-        return jsonify({
-            'status_code': response.status_code,
-            'response_text': response_text,
-            'success': response.status_code < 400,
-            'method_used': original_method,
-            'redirect_url': final_url,
-            'response_headers': dict(response.headers)
-        })
-        
-    except requests.exceptions.RequestException as e:
-        return jsonify({
-            'error': str(e),
-            'success': False,
-            'method_used': request_data.get('method', 'POST')
-        }), 500
-
+    # Total latency is bounded by the slowest target
+    results = forwarder.forward(targets, request_data)
+    
+    # Keep the first target's result at the top level for single-target clients
+    response_data = dict(results[0])
+    response_data['success'] = all(result['success'] for result in results)
+    response_data['results'] = results
+    
+    if all('error' in result for result in results):
+        return jsonify(response_data), 500
+    
+    return jsonify(response_data)
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))